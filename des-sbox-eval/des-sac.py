@@ -6,6 +6,7 @@
 # - https://datawok.net/posts/feistel-ciphers/#s-box
 # - https://link.springer.com/chapter/10.1007/3-540-39799-X_41#page-1
 
+import numpy as np
 
 # Preimage bits = 6
 # Image bits = 4
@@ -60,55 +61,77 @@ sbox = [
     ]
 ]
 
+# The same table as a single contiguous buffer of 8 · 64 images
+_SBOX = bytes(v for box in sbox for v in box)
+
+
+# Position in a box of the image of each preimage x.
+# The outer bits of x select the row and the inner bits the column.
+_PERM = bytes(((x & 0b100000) >> 4 | (x & 0b000001)) * 16 + ((x & 0b011110) >> 1) for x in range(64))
+
 
 def apply_box(box, x):
     """Applies the given substitution 'box' to the value 'x'"""
-    row = (x & 0b100000) >> 4 | (x & 0b000001)
-    col = (x & 0b011110) >> 1
-    return box[row * 16 + col]
-
-
-def bit_diff(a, b):
-    """Get the bits changed as a value from 0 to 1"""
-    count = 0;
-    r = a ^ b
-    # Image is 4 bits, so just consider the lowest 4 bits
-    for i in range(0, 4):
-        if r & 1 != 0:
-            count += 1
-        r >>= 1
-    # Normalize as a value between 0 and 1
-    return round(count / 4.0, 2)
+    return box[_PERM[x]]
+
 
+# All the possible preimages
+_X = np.arange(64)
+_PERM_ARR = np.frombuffer(_PERM, dtype = np.uint8)
+# Number of set bits for each 4-bit image
+_POPCNT4 = np.array([bin(v).count("1") for v in range(16)], dtype = np.uint8)
 
-def test_x(box, x):
-    """Get mean value of changed bits by toggling one bit of x according to the box"""
-    # Get the image for x according to the box
-    y = apply_box(box, x)
 
-    # Iterate over the all the input bits
-    diffs = []
+def boxes_flips(boxes):
+    """Get the number of changed image bits over all the preimages and the input bit toggles of each box"""
+    # images[:, x] is the image of x according to each box
+    images = boxes[:, _PERM_ARR]
+    count = 0
     for i in range(0, 6):
-        # Toggle the i-th input bit
-        x1 = x ^ (1 << i)
-        # Get the image for x1 according to the box
-        y1 = apply_box(box, x1)
-        # Get the amount of changed bits as a value from 0 to 1
-        diff = bit_diff(y, y1)
-        diffs.append(diff)
-    # Retun the mean of changed bits as a value from 0 to 1
-    tot = 0
-    for diff in diffs:
-        tot += diff
-    return tot / 6.0
+        # Changed bits for all the x when toggling the i-th input bit
+        count += _POPCNT4[images ^ images[:, _X ^ (1 << i)]].sum(axis = 1)
+    return count
+
+
+# Compiled version of `boxes_flips`, built on first use
+_boxes_flips_jit = None
+
+
+def boxes_flips_jit(boxes):
+    """Same as `boxes_flips`, but compiled with numba and parallel over the boxes.
+    Compilation takes about a second, so it only pays off for large batches of boxes."""
+    global _boxes_flips_jit
+    if _boxes_flips_jit is None:
+        from numba import njit, prange
+
+        @njit(parallel = True)
+        def kernel(boxes):
+            counts = np.zeros(boxes.shape[0], dtype = np.int64)
+            for b in prange(boxes.shape[0]):
+                for x in range(0, 64):
+                    y = boxes[b, _PERM_ARR[x]]
+                    for i in range(0, 6):
+                        # Accumulate in the int64 counts: uncompiled, a uint8 sum would wrap
+                        counts[b] += _POPCNT4[y ^ boxes[b, _PERM_ARR[x ^ (1 << i)]]]
+            return counts
+
+        _boxes_flips_jit = kernel
+    return _boxes_flips_jit(boxes)
+
+
+def boxes_sac(boxes, jit = False):
+    """Get the SAC value of each box in a sequence of boxes or in a flat buffer of boxes.
+    With `jit` the boxes are evaluated by the numba compiled kernel."""
+    if isinstance(boxes, (bytes, bytearray)):
+        boxes = np.frombuffer(boxes, dtype = np.uint8)
+    boxes = np.asarray(boxes, dtype = np.uint8).reshape(-1, 64)
+    flips = boxes_flips_jit(boxes) if jit else boxes_flips(boxes)
+    # Normalize as a value between 0 and 1
+    return flips / (64 * 6 * 4)
 
 
 def box_sac(box):
-    tot = 0
-    # Test the box for each possible block value x
-    for x in range(0, 64):
-        tot += test_x(box, x)
-    return tot / 64.0
+    return float(boxes_sac(box)[0])
 
 
 def box_sac_by_index(idx):
@@ -129,12 +152,11 @@ def box_print_by_index(idx):
 
 def test_full_sbox():
     """Test SAC property for the whole SBOX table"""
+    sac_values = boxes_sac(_SBOX)
     for i in range(0, len(sbox)):
         print("========================================")
-        box = get_box(i)
-        box_print(box)
-        sac_value = box_sac(box)
-        print("SAC VALUE: ", sac_value)
+        box_print(get_box(i))
+        print("SAC VALUE: ", float(sac_values[i]))
 
     
 def get_box(idx):
@@ -143,7 +165,7 @@ def get_box(idx):
     if idx >= num_boxes:
         idx = num_boxes - 1
         print("No such box, fallback to box {}".format(idx))
-    return sbox[idx]
+    return _SBOX[idx * 64:(idx + 1) * 64]
 
 
 if __name__ == "__main__":
@@ -18,9 +18,18 @@
 # with a configurable mean μ and standard deviation σ (with default μ = 1000
 # and σ = 50).
 
+import os
 import random
 import numpy as np
 import sys
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import ExitStack
+
+# Use GMP integers for the group operations arithmetic, if available
+try:
+    from gmpy2 import mpz
+except ImportError:
+    mpz = int
 
 # Primes to be used to reduce the group operation result
 primes = {
@@ -33,50 +42,87 @@ primes = {
 
 class Device():
     def __init__(self, keylen = 64, mu = 1000, sigma = 50):
-        self.p = primes[keylen]
+        self.p = mpz(primes[keylen])
         self.keylen = keylen
         self.mu = mu
         self.sigma = sigma
-        # Choose the group operation
-        self.group_op = self.double_and_add
-        # self.group_op = self.square_and_mul
+        # Generator of the artificial delays
+        self.rng = np.random.RandomState()
+        # Choose the group operation, given by its two steps:
+        # - double and add: res = 2·res, res = res + m
+        # - square and multiply: res = res², res = res·m
+        self.dbl_op, self.add_op = self.double, self.add
+        # self.dbl_op, self.add_op = self.square, self.mul
+
+    def double(self, res):
+        return (res * 2) % self.p
+
+    def add(self, res, m):
+        return (res + m) % self.p
+
+    def square(self, res):
+        return (res * res) % self.p
 
-    def double_and_add(self, m, d):
+    def mul(self, res, m):
+        return (res * m) % self.p
+
+    def delay(self, seeds, draws, skip = 0):
         '''
-        Returns the execution time of the double and add algorithm
+        Returns the sum of the delays drawn from the generator, where the
+        generator is reseeded with `seeds[k]` before drawing `draws[k]` delays.
+        The first `skip` delays drawn after the first seed are not summed.
         '''
-        res = 1
         delay = 0
-        np.random.seed(m % 2**32)
-        for i in range(len(d)):
-            res = (res * 2) % self.p
-            delay = delay + np.random.normal(self.mu, self.sigma)
-            if d[i] == 1:
-                res = (res + m) % self.p
-                np.random.seed(res % 2**32)
-                delay = delay + np.random.normal(self.mu, self.sigma)
-        return delay       
-
-    def square_and_mul(self, m, d):
+        for seed, n in zip(seeds, draws):
+            self.rng.seed(seed)
+            delay = delay + self.rng.normal(self.mu, self.sigma, n)[skip:].sum()
+            skip = 0
+        return delay
+
+    def group_op(self, m, d, nbits, state = None):
         '''
-        Returns the execution time of the double and add algorithm
+        Returns the state of the group operation after processing the `nbits`
+        bits of `d` (from the least significant one), i.e. the result, the
+        execution time, the last generator seed and the number of delays drawn
+        since then. If `state` is given, the operation is resumed from it and
+        `d` holds the bits following the already processed ones.
         '''
-        res = 1
-        delay = 0
-        np.random.seed(m % 2**32)
-        for i in range(len(d)):
-            res = (res * res) % self.p
-            delay = delay + np.random.normal(self.mu, self.sigma)
-            if d[i] == 1:
-                res = (res * m) % self.p
-                np.random.seed(res % 2**32)
-                delay = delay + np.random.normal(self.mu, self.sigma)
-        return delay       
+        m = mpz(m)
+        if state is None:
+            # The generator is seeded with `m` and then reseeded after each add
+            state = (mpz(1), 0, m % 2**32, 0)
+        res, delay, seed, skip = state
+        seeds = [seed]
+        draws = [skip]
+        for i in range(nbits):
+            res = self.dbl_op(res)
+            draws[-1] += 1
+            if (d >> i) & 1:
+                res = self.add_op(res, m)
+                seeds.append(res % 2**32)
+                draws.append(1)
+        delay = delay + self.delay(seeds, draws, skip)
+        return res, delay, seeds[-1], draws[-1]
  
 
 class AttackerDevice(Device):
-    def sign(self, c, d):
-        return self.group_op(c, d)   
+    def sign(self, c, d, nbits):
+        return self.group_op(c, d, nbits)[1]
+
+    def sign_next(self, c, state = None):
+        '''
+        Returns the states of the group operation resumed from `state` with a
+        0 bit and with a 1 bit
+        '''
+        state0 = self.group_op(c, 0, 1, state)
+        res, t0 = state0[:2]
+        # A 1 bit adds the delay of the add step, the only one drawn after
+        # reseeding with the added result
+        res = self.add_op(res, c)
+        seed = res % 2**32
+        self.rng.seed(seed)
+        state1 = (res, t0 + self.rng.normal(self.mu, self.sigma), seed, 1)
+        return state0, state1
 
 
 class VictimDevice(Device):
@@ -86,14 +132,15 @@ class VictimDevice(Device):
     def __init__(self, keylen = 64, mu = 1000, sigma = 50, secret_seed = built_in_seed):
         super().__init__(keylen, mu, sigma)
         np.random.seed(secret_seed)
-        self.secret = [1] + [int(np.random.rand() <= 0.5) for i in range(self.keylen - 1)]
-        print(self.secret)
+        self.secret_bits = np.concatenate(([1], np.random.rand(self.keylen - 1) <= 0.5)).astype(np.uint8)
+        # Bits packed into an integer (first bit as the least significant one)
+        self.secret = sum(int(bit) << i for i, bit in enumerate(self.secret_bits))
 
     def sign(self, c):
-        return self.group_op(c, self.secret)
+        return self.group_op(c, self.secret, self.keylen)[1]
 
     def check(self, d):
-        f = sum([int(self.secret[i] == d[i]) for i in range(self.keylen)])/self.keylen
+        f = float((self.secret_bits == np.asarray(d, dtype = np.uint8)).mean())
         if (f < 0.75):
             print('Less than 75% of key bits recovered.')
         elif (f < 1):
@@ -102,9 +149,81 @@ class VictimDevice(Device):
             print('100% of key bits recovered.')
 
 
+class AttackerShard():
+    '''
+    Attacker guessing the secret bits over a fixed shard of the messages.
+    Each bit guess resumes from the group operation states of the messages
+    instead of replaying the recovered bits.
+    '''
+    def __init__(self, keylen, mu, sigma, cs):
+        self.attacker = AttackerDevice(keylen, mu, sigma)
+        self.cs = cs
+        # Recovered bits, packed into an integer
+        self.recovered = 0
+        self.nrecovered = 0
+        # Group operation states after processing the first `nbits[k]`
+        # recovered bits. Messages skipped by an early decision lag behind.
+        self.states = [None] * len(cs)
+        self.nbits = [0] * len(cs)
+        # States after the guesses of the next bit
+        self.nexts = []
+
+    def commit(self, bit):
+        '''
+        Appends `bit` to the recovered bits
+        '''
+        for k, next_states in enumerate(self.nexts):
+            self.states[k] = next_states[bit]
+            self.nbits[k] = self.nrecovered + 1
+        self.recovered |= bit << self.nrecovered
+        self.nrecovered += 1
+        self.nexts = []
+
+    def sign_next(self, count):
+        '''
+        Returns the execution times of the next bit guesses (0 and 1) for the
+        next `count` messages of the shard
+        '''
+        times = []
+        for k in range(len(self.nexts), min(len(self.nexts) + count, len(self.cs))):
+            state = self.states[k]
+            lag = self.nrecovered - self.nbits[k]
+            if lag > 0:
+                state = self.attacker.group_op(self.cs[k], self.recovered >> self.nbits[k], lag, state)
+            state0, state1 = self.attacker.sign_next(self.cs[k], state)
+            self.nexts.append((state0, state1))
+            times.append((float(state0[1]), float(state1[1])))
+        return times
+
+
+# Attacker shard of a worker process
+worker_shard = None
+
+
+def init_worker(keylen, mu, sigma, cs):
+    global worker_shard
+    worker_shard = AttackerShard(keylen, mu, sigma, cs)
+
+
+def worker_sign_next(bit, count):
+    '''
+    Commits the last recovered `bit` (if not None) and returns the execution
+    times of the next bit guesses for the next `count` messages of the shard
+    '''
+    if bit is not None:
+        worker_shard.commit(bit)
+    return worker_shard.sign_next(count)
+
+
 def main():
-    # Iterations to compute the variance
+    # Max iterations to compute the variance
     N = 4000
+    # The variances are compared on increasing chunks of iterations, stopping
+    # as soon as the comparison is significant (z-score above the threshold)
+    chunk = 250
+    z_min = 5
+    # Processes sampling each chunk of iterations in parallel
+    workers = min(os.cpu_count() or 1, chunk)
     # Secret key length
     keylen = 64
     # Secret key seed
@@ -115,43 +234,65 @@ def main():
 
     # Devices construction
     victim = VictimDevice(keylen, mu, sigma, secret_seed = seed)
-    attacker = AttackerDevice(keylen, mu, sigma)
+
+    # Random messages and the time taken by the victim to sign them.
+    # These do not depend on the bit being recovered, so are measured once.
+    # The messages in [1, 2^keylen] are built from a single batch of random bytes.
+    nbytes = keylen // 8
+    buf = np.random.default_rng().bytes(N * nbytes)
+    cs = [int.from_bytes(buf[j * nbytes:(j + 1) * nbytes], "little") + 1 for j in range(N)]
+    t_vics = np.array([victim.sign(c) for c in cs])
 
     # List which saves the disclosed secret exponent bits (left to right)
-    print("Recovering {}-bit secret".format(attacker.keylen))
+    print("Recovering {}-bit secret".format(keylen))
     recovered = []
-    for i in range(0, keylen):
-        sum0 = 0
-        sum0_square = 0
-        sum1 = 0
-        sum1_square = 0
-        recovered.append(0)
-        for j in range (N):
-            c = random.randint(1, 2**keylen)
-            # Measure the time taken by the victim
-            t_vic = victim.sign(c)
-            # Try with i-th bit set to 0
-            recovered[i] = 0
-            t_att0 = attacker.sign(c, recovered)
-            sum0_square = sum0_square + (t_vic-t_att0)**2
-            sum0 = sum0 + (t_vic - t_att0)
-            # Try with i-th bit set to 1
-            recovered[i] = 1
-            t_att1 = attacker.sign(c, recovered)
-            sum1_square = sum1_square + (t_vic-t_att1)**2
-            sum1 = sum1 + (t_vic - t_att1)
-        # The chosen bit value is the one which gives a smaller variance
-        var0 = sum0_square/N - (sum0/N)**2
-        var1 = sum1_square/N - (sum1/N)**2
-        if var0 < var1:
-            recovered[i] = 0
-        else:
-            recovered[i] = 1
-        print(recovered[i], end = "")
-        sys.stdout.flush()
-    print("")
+    with ExitStack() as stack:
+        # Each worker process holds the attacker states of a fixed shard of the
+        # messages, so only the recovered bits and the times are exchanged.
+        # A single worker runs in a thread of this process instead.
+        Executor = ProcessPoolExecutor if workers > 1 else ThreadPoolExecutor
+        executors = []
+        for w in range(workers):
+            executor = Executor(1, initializer = init_worker, initargs = (keylen, mu, sigma, cs[w::workers]))
+            executors.append(stack.enter_context(executor))
+        bit = None
+        for i in range(0, keylen):
+            # Victim and attacker times of the `n` messages sampled so far
+            used = [0] * workers
+            n = 0
+            t_vic_used = np.empty(N)
+            t_att_used = np.empty((N, 2))
+            while n < N:
+                # Try with i-th bit set to 0 and to 1 on the next chunk,
+                # split among the workers
+                jobs = []
+                for w in range(workers):
+                    count = chunk // workers + int(w < chunk % workers)
+                    jobs.append(executors[w].submit(worker_sign_next, bit, count))
+                bit = None
+                for w, job in enumerate(jobs):
+                    times = np.array(job.result()).reshape(-1, 2)
+                    t_vic_used[n:n + len(times)] = t_vics[w::workers][used[w]:used[w] + len(times)]
+                    t_att_used[n:n + len(times)] = times
+                    used[w] += len(times)
+                    n += len(times)
+                # Paired samples whose mean is the difference of the two variances
+                x0 = t_vic_used[:n] - t_att_used[:n, 0]
+                x1 = t_vic_used[:n] - t_att_used[:n, 1]
+                diffs = (x0 - x0.mean())**2 - (x1 - x1.mean())**2
+                if abs(diffs.mean()) > z_min * diffs.std() / np.sqrt(n):
+                    break
+            # The chosen bit value is the one which gives a smaller variance
+            if diffs.mean() < 0:
+                bit = 0
+            else:
+                bit = 1
+            recovered.append(bit)
+    sys.stdout.write("".join(str(bit) for bit in recovered) + "\n")
 
     victim.check(recovered)
     print(recovered)
-    
-main()
+
+
+if __name__ == "__main__":
+    main()
@@ -29,11 +29,16 @@ from math import gcd
 
 
 def egcd(a, b):
-    if a == 0:
-        return (b, 0, 1)
-    else:
-        g, y, x = egcd(b % a, a)
-        return (g, x - (b // a) * y, y)
+    # Invariants: a·old_x + b·old_y = old_r  and  a·x + b·y = r
+    old_r, r = a, b
+    old_x, x = 1, 0
+    old_y, y = 0, 1
+    while r != 0:
+        q, rem = divmod(old_r, r)
+        old_r, r = r, rem
+        old_x, x = x, old_x - q * x
+        old_y, y = y, old_y - q * y
+    return (old_r, old_x, old_y)
 
 
 def main():
@@ -73,17 +78,11 @@ def main():
     # Attack requirement: 1 = e1·x + e2·y  i.e.  gcd(e1,e2) = 1
     assert g == 1, f"Secret exponents need to be coprime"
 
-    # c1^x · c2^y = m^(e1·x) · m^(e2·y) = m^(e1·x + e2·y) 
-    m_dec = (pow(c1, x, n) * pow(c2, y, n)) % n   
-    assert m_dec == m, f"Unexpected failure"  
-    
-    # Typically y < 0. So if we are working with unsigned values...
-    # c1^x · (c2^-1)^-y 
-    min_y = -y
-    inv_c2 = pow(c2, -1, n)
-    m_dec = pow(c1, x, n) * pow(inv_c2, min_y, n) % n
+    # c1^x · c2^y = m^(e1·x + e2·y)
+    # Typically y < 0, in which case `pow` computes (c2^-1)^-y
+    m_dec = (pow(c1, x, n) * pow(c2, y, n)) % n
     print(f"[recovered m: {m_dec}]")
-    assert m_dec == m, f"Unexpected failure"  
+    assert m_dec == m, f"Unexpected failure"
 
 
 main()
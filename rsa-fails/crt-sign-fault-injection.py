@@ -34,23 +34,38 @@
 # Thus for `gcd(S - S', n)` we ignored that `S-S'` was reduced modulo n.
 
 
+from functools import lru_cache
 from math import gcd
 
 
+@lru_cache
+def precompute(p, q, e):
+    """Get the secret exponent and the CRT signing constants for the given key"""
+    phi_n = (p-1)*(q-1)
+    d = pow(e, -1, phi_n)
+    # m^dp ≡ m^d mod p and m^dq ≡ m^d mod q by Fermat
+    dp = d % (p - 1)
+    dq = d % (q - 1)
+    qinv = pow(q, -1, p)
+    pinv = pow(p, -1, q)
+    return d, dp, dq, qinv, pinv
+
+
 # Setup values
 p = 1269137899329015734198852969175332151915502982003874425987364731216285546438096536038703243719054337
 q = 6504286590288767118032686861713724448149119312357868347142148568446447367009371975895368151336893777
 n = p*q
-phi_n = (p-1)*(q-1)
 e = 65537
-d = pow(e, -1, phi_n)
+d, dp, dq, qinv, pinv = precompute(p, q, e)
 
 m = 1234519048532148324
 
 # Sign the message (CRT)
-s1 = pow(m, d, p)
-s2 = pow(m, d, q)
-s = (s1 * q * pow(q, -1, p) + s2 * p * pow(p, -1, q)) % n
+s1 = pow(m, dp, p)
+s2 = pow(m, dq, q)
+# Sp·q·(q^(-1) mod p) term, shared by the correct and faulty signatures
+a = s1 * q * qinv
+s = (a + s2 * p * pinv) % n
 
 # Assert correctness of CRT signature (just in case...)
 assert s == pow(m, d, n), f"Something went wrong, are p and q coprimes?"
@@ -58,7 +73,7 @@ assert s == pow(m, d, n), f"Something went wrong, are p and q coprimes?"
 # Let's simulate a fault during signature computation of s2 value
 r = 91238102380912903
 assert gcd(r, q) == 1, f"The random fault should be coprime with q"
-f = (s1 * q * pow(q, -1, p) + r * p * pow(p, -1, q)) % n
+f = (a + r * p * pinv) % n
 
 # The attacker receives both `s` and `f`.
 # He can easily recover `p` and `q` (and thus the secret `d`)